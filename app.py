@@ -1,29 +1,180 @@
 import streamlit as st
 import google.generativeai as genai
+import pandas as pd
+import asyncio
+import orjson
 import yaml
+import json
 import os
+import re
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 import time
+from collections import defaultdict
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# C-accelerated YAML parser when libyaml is available, pure-Python otherwise
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Shared across all variants of one generation; kept separate from the
+# per-variant tail so a batch formats it only once
+PROMPT_PREFIX = """
+Generate a high-converting sales letter with the following specifications:
+
+PRODUCT DETAILS:
+- Name: {name}
+- Type: {type}
+- Key Features: {features}
+- Unique Value Proposition: {uvp}
+
+TARGET AUDIENCE:
+- Primary Audience: {primary}
+- Pain Points: {pain_points}
+- Desired Outcomes: {desired_outcomes}
+"""
+
+PROMPT_VARIANT_TAIL = """
+CUSTOMIZATION:
+- Tone: {tone}
+- Length: {length}
+- Key Emphasis: {emphasis}
+
+{knowledge_context}
+
+REQUIREMENTS:
+1. Structure the letter with clear sections
+2. Use persuasive copywriting techniques
+3. Include emotional triggers
+4. Create a compelling narrative
+5. End with strong call-to-action
+6. Format in Markdown with clear headings
+
+IMPORTANT: Avoid using any marketing hype or exaggerated claims. Focus on genuine value and benefits.
+
+Generate the sales letter:
+"""
+
+@st.cache_resource
+def _load_yaml(path, mtime):
+    """Parse a YAML file, cached per (path, mtime) so file edits invalidate the cache"""
+    # JSON sidecar skips the much slower YAML parser on cold starts
+    cache_path = path + '.json'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= mtime:
+        try:
+            with open(cache_path, 'r') as file:
+                return json.load(file)
+        except ValueError:
+            pass  # truncated/corrupt sidecar: reparse the YAML and rewrite it
+
+    with open(path, 'r') as file:
+        data = yaml.load(file, Loader=_YAML_LOADER)
+
+    # Write to a temp file and rename so an interrupted dump never leaves a
+    # half-written sidecar behind
+    try:
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass  # read-only filesystem: just skip the sidecar
+
+    return data
+
+def _load_config(path):
+    """Load a YAML config through the mtime-keyed cache"""
+    return _load_yaml(path, os.path.getmtime(path))
+
+def _is_word_char(char):
+    """Mirror the regex \\w class used by the fallback matcher's \\b anchors"""
+    return char.isalnum() or char == '_'
+
+def _match_case(source, replacement):
+    """Carry the casing of a matched word over to its replacement"""
+    if len(source) > 1 and source.isupper():
+        return replacement.upper()
+    if source[:1].isupper():
+        return replacement.capitalize()
+    return replacement
+
+# Response cache shared by the streaming and batch paths; hand-rolled because
+# st.cache_data cannot wrap generators or partial batch hits
+RESPONSE_CACHE_TTL = 86400
+RESPONSE_CACHE_MAX_ENTRIES = 100
+
+@st.cache_resource
+def _response_cache():
+    """Prompt -> (timestamp, letter) store, one per process"""
+    return {}
+
+def _cache_get(prompt):
+    """Return the cached letter for a prompt, dropping expired entries"""
+    entry = _response_cache().get(prompt)
+    if entry is None:
+        return None
+    timestamp, letter = entry
+    if time.time() - timestamp > RESPONSE_CACHE_TTL:
+        del _response_cache()[prompt]
+        return None
+    return letter
+
+def _cache_put(prompt, letter):
+    """Store a letter for a prompt, evicting the oldest entry when full"""
+    cache = _response_cache()
+    if len(cache) >= RESPONSE_CACHE_MAX_ENTRIES:
+        cache.pop(next(iter(cache)))
+    cache[prompt] = (time.time(), letter)
+
 class SalesLetterGenerator:
     def __init__(self):
         self.load_configs()
         self.setup_gemini()
-        
+
     def load_configs(self):
         """Load all configuration files"""
-        with open('config.yaml', 'r') as file:
-            self.config = yaml.safe_load(file)
-        
-        with open('prohibited_words.yaml', 'r') as file:
-            self.prohibited_config = yaml.safe_load(file)
-        
-        with open('knowledge_base.yaml', 'r') as file:
-            self.knowledge_base = yaml.safe_load(file)
+        self.config = _load_config('config.yaml')
+        self.prohibited_config = _load_config('prohibited_words.yaml')
+        self.knowledge_base = _load_config('knowledge_base.yaml')
+        self._build_prohibited_matcher()
+        self._build_knowledge_index()
+
+    def _build_knowledge_index(self):
+        """Build id and tag lookup indexes over the knowledge base"""
+        self._by_id = {item['id']: item for item in self.knowledge_base['knowledge_items']}
+        self._by_tag = defaultdict(set)
+        for item in self.knowledge_base['knowledge_items']:
+            item['_title_lc'] = item['title'].lower()
+            item['_content_lc'] = item['content'].lower()
+            haystack = item['_title_lc'] + ' ' + item['_content_lc']
+            item['_grams'] = {haystack[i:i + 3] for i in range(len(haystack) - 2)}
+            for tag in item['tags']:
+                self._by_tag[tag].add(item['id'])
+        self._all_tags = sorted(self._by_tag)
+
+    def _build_prohibited_matcher(self):
+        """Build the prohibited word matcher: Aho-Corasick automaton, or one compiled regex as fallback"""
+        words = self.prohibited_config['prohibited_words']
+        replacements = self.prohibited_config['replacements']
+        self._replacements = {word.lower(): replacements.get(word, word) for word in words}
+        self._word_forms = {word.lower(): word for word in words}
+
+        if ahocorasick is not None:
+            self._prohibited_automaton = ahocorasick.Automaton()
+            for word in words:
+                self._prohibited_automaton.add_word(word.lower(), (word, replacements.get(word, word)))
+            self._prohibited_automaton.make_automaton()
+            self._prohibited_re = None
+        else:
+            pattern = '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+            self._prohibited_re = re.compile(r'\b(' + pattern + r')\b', re.IGNORECASE)
+            self._prohibited_automaton = None
     
     def setup_gemini(self):
         """Configure Gemini API"""
@@ -36,87 +187,179 @@ class SalesLetterGenerator:
         self.model = genai.GenerativeModel('gemini-pro')
     
     def detect_prohibited_words(self, text):
-        """Detect and replace prohibited words"""
+        """Detect and replace prohibited words in a single pass over the text"""
+        if self._prohibited_automaton is not None:
+            return self._detect_with_automaton(text)
+        return self._detect_with_regex(text)
+
+    def _detect_with_regex(self, text):
+        """Fallback matcher: one compiled alternation, one substitution pass"""
         detected_words = []
-        clean_text = text
-        
-        for word in self.prohibited_config['prohibited_words']:
-            if word.lower() in text.lower():
+
+        def _replace(match):
+            lower = match.group(0).lower()
+            original = self._word_forms[lower]
+            if original not in detected_words:
+                detected_words.append(original)
+            return _match_case(match.group(0), self._replacements[lower])
+
+        return self._prohibited_re.sub(_replace, text), detected_words
+
+    def _detect_with_automaton(self, text):
+        """Locate and replace all prohibited words with one automaton walk"""
+        matches = []
+        for end, (word, replacement) in self._prohibited_automaton.iter(text.lower()):
+            start = end - len(word) + 1
+            # Whole words only, matching the \b anchors of the regex fallback
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if end + 1 < len(text) and _is_word_char(text[end + 1]):
+                continue
+            matches.append((start, end + 1, word, replacement))
+
+        if not matches:
+            return text, []
+
+        # Keep the leftmost-longest of any overlapping matches
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+
+        detected_words = []
+        pieces = []
+        position = 0
+        for start, end, word, replacement in matches:
+            if start < position:
+                continue
+            if word not in detected_words:
                 detected_words.append(word)
-                replacement = self.prohibited_config['replacements'].get(word, word)
-                clean_text = clean_text.replace(word, replacement)
-                clean_text = clean_text.replace(word.capitalize(), replacement.capitalize())
-        
-        return clean_text, detected_words
+            pieces.append(text[position:start])
+            pieces.append(_match_case(text[start:end], replacement))
+            position = end
+        pieces.append(text[position:])
+
+        return ''.join(pieces), detected_words
     
     def search_knowledge(self, tags=None, query=None):
         """Search knowledge base by tags or query"""
-        results = []
-        
-        for item in self.knowledge_base['knowledge_items']:
-            if tags:
-                if any(tag in item['tags'] for tag in tags):
-                    results.append(item)
-            elif query and query.lower() in item['title'].lower() or query.lower() in item['content'].lower():
-                results.append(item)
-        
-        return results
+        if tags:
+            ids = set().union(*(self._by_tag[tag] for tag in tags))
+            return [self._by_id[knowledge_id] for knowledge_id in sorted(ids)]
+
+        if not query:
+            return []
+
+        q = query.lower()
+        candidates = self.knowledge_base['knowledge_items']
+        if len(q) >= 3:
+            # Trigram prefilter: every trigram of the query must appear in the item
+            q_grams = {q[i:i + 3] for i in range(len(q) - 2)}
+            candidates = [item for item in candidates if q_grams <= item['_grams']]
+        return [item for item in candidates
+                if q in item['_title_lc'] or q in item['_content_lc']]
     
-    def generate_sales_letter(self, product_details, audience_details, customization, selected_knowledge):
-        """Generate sales letter using Gemini API"""
-        
-        # Build knowledge context
-        knowledge_context = ""
-        if selected_knowledge:
-            knowledge_context = "RELEVANT COPYWRITING KNOWLEDGE:\n"
-            for knowledge_id in selected_knowledge:
-                knowledge_item = next((item for item in self.knowledge_base['knowledge_items'] if item['id'] == knowledge_id), None)
-                if knowledge_item:
-                    knowledge_context += f"\n{knowledge_item['title']}:\n{knowledge_item['content']}\n"
-        
-        prompt = f"""
-        Generate a high-converting sales letter with the following specifications:
-        
-        PRODUCT DETAILS:
-        - Name: {product_details['name']}
-        - Type: {product_details['type']}
-        - Key Features: {product_details['features']}
-        - Unique Value Proposition: {product_details['uvp']}
-        
-        TARGET AUDIENCE:
-        - Primary Audience: {audience_details['primary']}
-        - Pain Points: {audience_details['pain_points']}
-        - Desired Outcomes: {audience_details['desired_outcomes']}
-        
-        CUSTOMIZATION:
-        - Tone: {customization['tone']}
-        - Length: {customization['length']}
-        - Key Emphasis: {customization['emphasis']}
-        
-        {knowledge_context}
-        
-        REQUIREMENTS:
-        1. Structure the letter with clear sections
-        2. Use persuasive copywriting techniques
-        3. Include emotional triggers
-        4. Create a compelling narrative
-        5. End with strong call-to-action
-        6. Format in Markdown with clear headings
-        
-        IMPORTANT: Avoid using any marketing hype or exaggerated claims. Focus on genuine value and benefits.
-        
-        Generate the sales letter:
-        """
-        
+    def generate_sales_letters(self, product_details, audience_details, variants, selected_knowledge):
+        """Generate one sales letter per customization variant in a single batched call"""
+        # The prefix and knowledge context are identical for every variant: build once
+        prefix = self._build_prompt_prefix(product_details, audience_details)
+        knowledge_context = self._knowledge_context(selected_knowledge)
+        prompts = [prefix + self._build_variant_tail(customization, knowledge_context)
+                   for customization in variants]
+
+        # Serve at most one copy of each distinct prompt from the cache; duplicate
+        # prompts in a batch are sampled fresh so repeat clicks still get N
+        # distinct variants
+        letters = [None] * len(prompts)
+        seen = set()
+        missing = []
+        for i, prompt in enumerate(prompts):
+            if prompt not in seen:
+                seen.add(prompt)
+                letters[i] = _cache_get(prompt)
+            if letters[i] is None:
+                missing.append(i)
+
+        async def _generate_missing():
+            responses = await asyncio.gather(
+                *[self.model.generate_content_async(prompts[i]) for i in missing]
+            )
+            return [response.text for response in responses]
+
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            if missing:
+                for i, letter in zip(missing, asyncio.run(_generate_missing())):
+                    letters[i] = letter
+                    _cache_put(prompts[i], letter)
+            return letters
         except Exception as e:
             raise Exception(f"Generation failed: {str(e)}")
 
+    def stream_sales_letter(self, product_details, audience_details, customization, selected_knowledge):
+        """Stream a sales letter chunk by chunk as Gemini generates it"""
+        prompt = self._build_prompt(product_details, audience_details, customization, selected_knowledge)
+
+        cached = _cache_get(prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                parts.append(chunk.text)
+                yield chunk.text
+        except Exception as e:
+            raise Exception(f"Generation failed: {str(e)}")
+
+        _cache_put(prompt, ''.join(parts))
+
+    def _build_prompt_prefix(self, product_details, audience_details):
+        """Format the product/audience section shared by every variant"""
+        return PROMPT_PREFIX.format(
+            name=product_details['name'],
+            type=product_details['type'],
+            features=product_details['features'],
+            uvp=product_details['uvp'],
+            primary=audience_details['primary'],
+            pain_points=audience_details['pain_points'],
+            desired_outcomes=audience_details['desired_outcomes']
+        )
+
+    def _build_variant_tail(self, customization, knowledge_context):
+        """Format the per-variant customization and knowledge section"""
+        return PROMPT_VARIANT_TAIL.format(
+            tone=customization['tone'],
+            length=customization['length'],
+            emphasis=customization['emphasis'],
+            knowledge_context=knowledge_context
+        )
+
+    def _knowledge_context(self, selected_knowledge):
+        """Render the selected knowledge items for the prompt"""
+        if not selected_knowledge:
+            return ""
+        return "RELEVANT COPYWRITING KNOWLEDGE:\n" + "\n".join(
+            f"\n{item['title']}:\n{item['content']}"
+            for item in (self._by_id[knowledge_id] for knowledge_id in selected_knowledge
+                         if knowledge_id in self._by_id)
+        )
+
+    def _build_prompt(self, product_details, audience_details, customization, selected_knowledge):
+        """Build the full generation prompt"""
+        return (self._build_prompt_prefix(product_details, audience_details)
+                + self._build_variant_tail(customization, self._knowledge_context(selected_knowledge)))
+
+@st.cache_resource
+def get_generator():
+    """Construct the generator once per process and reuse it across reruns"""
+    return SalesLetterGenerator()
+
+@st.cache_data
+def _knowledge_for_tags(tag_key):
+    """Knowledge items matching a tag selection, cached per tag tuple"""
+    return get_generator().search_knowledge(tags=list(tag_key))
+
 def main():
     # Initialize generator
-    generator = SalesLetterGenerator()
+    generator = get_generator()
     
     # Page configuration
     st.set_page_config(
@@ -136,6 +379,8 @@ def main():
         st.session_state.form_data = {}
     if 'generated_letter' not in st.session_state:
         st.session_state.generated_letter = None
+    if 'generated_variants' not in st.session_state:
+        st.session_state.generated_variants = None
     if 'generation_time' not in st.session_state:
         st.session_state.generation_time = None
     
@@ -213,17 +458,24 @@ def main():
             st.subheader("📚 Copywriting Knowledge")
             st.markdown("Select relevant copywriting frameworks to guide the generation:")
             
-            available_tags = list(set(tag for item in generator.knowledge_base['knowledge_items'] for tag in item['tags']))
+            available_tags = generator._all_tags
             selected_tags = st.multiselect("Search by tags:", available_tags)
-            
-            knowledge_results = generator.search_knowledge(tags=selected_tags)
-            
+
+            knowledge_results = _knowledge_for_tags(tuple(selected_tags))
+
             selected_knowledge = []
-            for item in knowledge_results:
-                if st.checkbox(f"{item['id']}: {item['title']}", key=item['id']):
-                    selected_knowledge.append(item['id'])
-                    with st.expander("View Details"):
-                        st.markdown(item['content'])
+            if knowledge_results:
+                saved = set(st.session_state.form_data.get('selected_knowledge', []))
+                knowledge_df = pd.DataFrame(knowledge_results)[['id', 'title', 'content']]
+                knowledge_df.insert(0, 'select', knowledge_df['id'].isin(saved))
+                edited = st.data_editor(
+                    knowledge_df,
+                    hide_index=True,
+                    disabled=['id', 'title', 'content'],
+                    column_config={'select': st.column_config.CheckboxColumn("Select")},
+                    use_container_width=True
+                )
+                selected_knowledge = edited.loc[edited['select'], 'id'].tolist()
             
             if st.form_submit_button("Save & Continue"):
                 if all([primary_audience, pain_points, desired_outcomes]):
@@ -256,6 +508,9 @@ def main():
             with col2:
                 key_emphasis = st.selectbox("Key Emphasis*",
                                           ["Problem-Solution", "Benefits-Focused", "Social Proof", "Urgency", "Transformation"])
+
+                num_variants = st.slider("Variants to Generate", 1, 5, 1,
+                                       help="Multiple variants are generated in a single batched request")
             
             st.session_state.form_data.update({
                 'tone': tone,
@@ -265,58 +520,75 @@ def main():
             
             # Review section
             st.subheader("📋 Review Your Input")
-            st.json({k: v for k, v in st.session_state.form_data.items() if k != 'selected_knowledge'})
+            st.json(orjson.dumps(
+                {k: v for k, v in st.session_state.form_data.items() if k != 'selected_knowledge'}
+            ).decode())
             
             if st.session_state.form_data.get('selected_knowledge'):
                 st.markdown("**Selected Knowledge IDs:**")
                 st.code(", ".join(st.session_state.form_data['selected_knowledge']))
             
             if st.form_submit_button("🚀 Generate Sales Letter"):
-                with st.spinner(f"Generating sales letter (max {generator.config['app']['max_generation_time']} seconds)..."):
-                    start_time = time.time()
-                    
-                    try:
-                        # Prepare data for generation
-                        product_details = {
-                            'name': st.session_state.form_data['product_name'],
-                            'type': st.session_state.form_data['product_type'],
-                            'features': st.session_state.form_data['key_features'],
-                            'uvp': st.session_state.form_data['uvp']
-                        }
-                        
-                        audience_details = {
-                            'primary': st.session_state.form_data['primary_audience'],
-                            'pain_points': st.session_state.form_data['pain_points'],
-                            'desired_outcomes': st.session_state.form_data['desired_outcomes']
-                        }
-                        
-                        customization = {
-                            'tone': st.session_state.form_data['tone'],
-                            'length': st.session_state.form_data['length'],
-                            'emphasis': st.session_state.form_data['emphasis']
-                        }
-                        
-                        selected_knowledge = st.session_state.form_data.get('selected_knowledge', [])
-                        
-                        # Generate sales letter
-                        sales_letter = generator.generate_sales_letter(
+                start_time = time.time()
+
+                try:
+                    # Prepare data for generation
+                    product_details = {
+                        'name': st.session_state.form_data['product_name'],
+                        'type': st.session_state.form_data['product_type'],
+                        'features': st.session_state.form_data['key_features'],
+                        'uvp': st.session_state.form_data['uvp']
+                    }
+
+                    audience_details = {
+                        'primary': st.session_state.form_data['primary_audience'],
+                        'pain_points': st.session_state.form_data['pain_points'],
+                        'desired_outcomes': st.session_state.form_data['desired_outcomes']
+                    }
+
+                    customization = {
+                        'tone': st.session_state.form_data['tone'],
+                        'length': st.session_state.form_data['length'],
+                        'emphasis': st.session_state.form_data['emphasis']
+                    }
+
+                    selected_knowledge = st.session_state.form_data.get('selected_knowledge', [])
+
+                    if num_variants > 1:
+                        # Generate all requested variants in one batched call
+                        with st.spinner(f"Generating {num_variants} variants (max {generator.config['app']['max_generation_time']} seconds)..."):
+                            sales_letters = generator.generate_sales_letters(
+                                product_details, audience_details, [customization] * num_variants, selected_knowledge
+                            )
+                    else:
+                        # Stream the letter so the first tokens appear immediately
+                        st.markdown("### ✍️ Generating...")
+                        sales_letters = [st.write_stream(generator.stream_sales_letter(
                             product_details, audience_details, customization, selected_knowledge
-                        )
-                        
-                        # Detect and replace prohibited words
-                        clean_letter, detected_words = generator.detect_prohibited_words(sales_letter)
-                        
-                        end_time = time.time()
-                        generation_time = end_time - start_time
-                        
-                        # Store results
-                        st.session_state.generated_letter = clean_letter
-                        st.session_state.generation_time = generation_time
-                        st.session_state.detected_words = detected_words
-                        st.session_state.selected_knowledge = selected_knowledge
-                        
-                    except Exception as e:
-                        st.error(f"Generation failed: {str(e)}")
+                        ))]
+
+                    # Detect and replace prohibited words
+                    clean_letters = []
+                    detected_words = []
+                    for sales_letter in sales_letters:
+                        clean_letter, words = generator.detect_prohibited_words(sales_letter)
+                        clean_letters.append(clean_letter)
+                        detected_words.extend(word for word in words if word not in detected_words)
+
+                    end_time = time.time()
+                    generation_time = end_time - start_time
+
+                    # Store results
+                    st.session_state.generated_letter = clean_letters[0]
+                    st.session_state.generated_variants = clean_letters
+                    st.session_state.generation_time = generation_time
+                    st.session_state.detected_words = detected_words
+                    st.session_state.selected_knowledge = selected_knowledge
+
+                except Exception as e:
+                    st.error(f"Generation failed: {str(e)}")
+                else:
+                    st.rerun()
     
     # Display Results
     if st.session_state.generated_letter:
@@ -347,7 +619,14 @@ def main():
         
         # Sales letter display
         st.markdown("### Final Sales Letter")
-        st.markdown(st.session_state.generated_letter)
+        variants = st.session_state.get('generated_variants') or [st.session_state.generated_letter]
+        if len(variants) > 1:
+            tabs = st.tabs([f"Variant {i + 1}" for i in range(len(variants))])
+            for tab, variant in zip(tabs, variants):
+                with tab:
+                    st.markdown(variant)
+        else:
+            st.markdown(st.session_state.generated_letter)
         
         # Download options
         col1, col2 = st.columns(2)